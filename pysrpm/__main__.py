@@ -2,8 +2,6 @@
 """ Command line interface to the RPM converter tool """
 
 import click
-import collections
-import configparser
 from pysrpm.rpm import RPM
 
 
@@ -18,20 +16,18 @@ def list_flavours(context, option, value):
     if not value or context.resilient_parsing:
         return
 
-    config = configparser.RawConfigParser(dict_type=collections.OrderedDict)
-    with RPM.preset_configs() as presets_list:
-        config.read(presets_list)
-
     click.echo('Available flavours:')
-    for section in config.sections():
+    for section in RPM.load_presets():
         if section != 'pysrpm':
             click.echo(f'- {section}')
 
     context.exit(0)
 
 
-@click.command(help='Convert a python source package to RPM')
-@click.argument('source', type=click.Path(exists=True), nargs=1)
+@click.command(help='Convert python source packages to RPM')
+@click.argument('sources', type=click.Path(exists=True), nargs=-1, required=True)
+@click.option('--jobs', '-j', type=click.IntRange(min=1), default=1,
+              help='Number of source packages to convert in parallel, each in a subdirectory of the build directory')
 @click.option('--flavour', '-f', help='RPM targets a specific linux flavour', type=str, default=None)
 @click.option('--config', '-c', type=click.Path(exists=True, dir_okay=False),
               help='Specify a config file manually, replaces any configuration from within the package')
@@ -56,17 +52,17 @@ def list_flavours(context, option, value):
 @click.option('--template', '-t', 'templates', multiple=True, type=(str, str), metavar='<template-key> <value>',
               help='Override a specific template (repeatable)')
 @click.help_option('--help', '-h')
-def cli(source, templates=[], **kwargs):
+def cli(sources, jobs=1, templates=[], **kwargs):
     """ Handle command line interface. Options passed on the command line override options from any config file.
 
     Args:
-        source (:class:`~click.Path`): the source package to convert
+        sources (`tuple` of :class:`~click.Path`): the source packages to convert
+        jobs (`int`): the maximum number of source packages to convert in parallel
         templates (`list` of 2-`str`-tuples): the key / value pairs to define templates on the command line
     """
     options = {option.replace('-', '_'): value for option, value in kwargs.items() if value is not None}
     templates = {option.replace('-', '_'): value for option, value in templates}
-    with RPM(source, **options, cli_templates=templates) as rpm_builder:
-        rpm_builder.run()
+    RPM.run_many(sources, jobs, templates=templates, **options)
 
 
 if __name__ == '__main__':
@@ -2,8 +2,8 @@
 import os
 import re
 import sys
-import tomli
-import email
+import errno
+import email.parser
 import shutil
 import tarfile
 import pathlib
@@ -12,12 +12,15 @@ import tempfile
 import functools
 import subprocess
 import contextlib
+import concurrent.futures
 import configparser
-import pep517.meta
 import pep517.build
+import pep517.wrappers
 from packaging.requirements import Requirement
 from packaging.specifiers import SpecifierSet
-from collections import OrderedDict
+from packaging.version import Version, InvalidVersion
+from collections import OrderedDict, defaultdict
+from string import Formatter
 
 try:
     import importlib.resources as importlib_resources
@@ -29,8 +32,92 @@ try:
 except ImportError:
     import importlib_metadata
 
+try:
+    import tomllib
+except ImportError:
+    import tomli as tomllib
+
+try:
+    import rpm as librpm
+except ImportError:
+    librpm = None
+
 from pysrpm.convert import specifier_to_rpm_version, simplify_marker_to_rpm_condition, python_version_to_rpm_version
 
+_rpm_build_subdirs = ('SOURCES', 'SPECS', 'BUILD', 'RPMS', 'SRPMS')
+# Read and copy tarballs by large chunks rather than tarfile’s default 10 to 16 KiB
+_tar_bufsize = 4 * 1024 * 1024
+# Options under [pysrpm] that are flags
+_boolean_options = {'spec_only', 'source_only', 'binary_only', 'keep_temp', 'dry_run', 'extract_dependencies'}
+_formatter = Formatter()
+# Errors from os.link meaning a hard link is not possible here, but a copy is
+_link_fallback_errnos = {errno.EXDEV, errno.EPERM, errno.EACCES, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP}
+_metadata_files = {'pyproject.toml', 'PKG-INFO', 'setup.cfg', 'setup.py', 'entry_points.txt'}
+_egg_info_files = {'PKG-INFO', 'entry_points.txt'}
+
+
+@functools.cache
+def _parse_requirement(req):
+    """ Parse a requirement string once, as the same requirements are converted for every set of extras
+
+    Args:
+        req (`str`): The string representation of a python dependency
+
+    Returns:
+        :class:`~packaging.requirements.Requirement`: The parsed requirement, which must not be modified
+    """
+    return Requirement(req)
+
+
+@functools.cache
+def _compile_patterns(patterns):
+    """ Compile whitespace-separated shell-style patterns, such as the extras templates, into a single regex
+
+    Args:
+        patterns (`str`): The patterns, as accepted by :func:`~fnmatch.fnmatch`
+
+    Returns:
+        :class:`~re.Pattern`: A regex that fully matches strings matching any of the patterns
+    """
+    return re.compile('|'.join(fnmatch.translate(pattern) for pattern in patterns.split()) or '(?!)')
+
+
+@functools.cache
+def _template_lines(template):
+    """ Split a template into lines once, and find the keys each line needs, as the same templates are reused
+
+    Args:
+        template (`str`): The template of a spec file section
+
+    Returns:
+        `tuple` of (`str`, `frozenset`) pairs: The lines of the template with the names of the keys they format
+    """
+    lines = []
+    for line in template.split('\n'):
+        try:
+            # Only the key name is looked up in the values, the rest of the field is attribute or item access
+            fields = frozenset(re.match(r'[^.[]*', field).group() for _, field, _, _ in _formatter.parse(line)
+                               if field is not None)
+        except ValueError as err:
+            raise ValueError(f'Error formatting line: {line}') from err
+        lines.append((line, fields))
+    return tuple(lines)
+
+
+@functools.cache
+def _gnu_tar():
+    """ Check once whether the tar command is GNU tar, as other tars (e.g. bsdtar) do not support our options
+
+    Returns:
+        `bool`: `True` iff a tar command is available and is GNU tar
+    """
+    try:
+        version = subprocess.run(['tar', '--version'], capture_output=True, encoding='utf-8', errors='replace',
+                                 check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return 'GNU tar' in version
+
 
 class RPMBuildError(Exception):
     """ rpmbuild encountered an error """
@@ -39,22 +126,23 @@ class RPMBuildError(Exception):
 
 class RPM:
     """ Given a python source distribution and a template config, build source, binary, or spec RPM files """
-    def __init__(self, source, config=None, templates={}, **options):
+    def __init__(self, source, config=None, templates={}, build_subdir=None, **options):
         """ Setup the various configurations and templates to start converting
 
         Args:
             source (`str` or path-like): Path to the source package to convert
             config (`str` or path-like): Path to a configuration file
             templates (`dict`): CLI-specified template items
+            build_subdir (`str`): Subdirectory of the build directory to use, to isolate concurrent conversions
         """
         self.config = configparser.ConfigParser(interpolation=configparser.ExtendedInterpolation(),
                                                 dict_type=OrderedDict)
-        with self.preset_configs() as config_lists:
-            self.config.read(config_lists)
+        self.config.read_dict(RPM.load_presets(), source='<presets>')
 
         self.config_file = config
         self.cli_options = options
         self.cli_templates = templates
+        self.build_subdir = build_subdir
         source = pathlib.Path(source)
         if not source.exists():
             raise FileNotFoundError(str(source))
@@ -70,6 +158,21 @@ class RPM:
             yield sorted(defaults_path.glob('*.conf'))
 
 
+    @functools.cache
+    @staticmethod
+    def load_presets():
+        """ Parse the preset configurations once per process
+
+        Returns:
+            `dict`: A dictionary of section names to dictionaries of raw (non-interpolated) section contents,
+                    which must not be modified
+        """
+        config = configparser.RawConfigParser(dict_type=OrderedDict)
+        with RPM.preset_configs() as presets_list:
+            config.read(presets_list)
+        return OrderedDict((section, OrderedDict(config.items(section))) for section in config.sections())
+
+
     def __enter__(self):
         """ Context manager to inspect the contents of a source package in a temporary non-archive directory
 
@@ -84,11 +187,20 @@ class RPM:
             raise ValueError('Expected tarball as source file')
 
         self.tempdir = pathlib.Path(tempfile.mkdtemp())
-        with tarfile.open(self.source) as tf:
-            for name in tf.getnames():
-                if any(fnmatch.fnmatch(name, pat) for pat in ['*/pyproject.toml', '*/PKG-INFO', '*/setup.cfg',
-                                                              '*/setup.py', '*/entry_points.txt']):
-                    tf.extract(name, self.tempdir)
+        # Single streaming pass over the archive, extracting members as we encounter them. A large read buffer
+        # spans many 512-byte tar headers per read call.
+        with open(self.source, 'rb', buffering=_tar_bufsize) as raw, \
+                tarfile.open(fileobj=raw, mode='r|*', bufsize=_tar_bufsize, copybufsize=_tar_bufsize) as tf:
+            for member in tf:
+                if not member.isfile():
+                    continue
+                # Only files directly in the package’s top-level directory are used, and those in its egg-info
+                name = member.name[2:] if member.name.startswith('./') else member.name
+                head, sep, tail = name.rpartition('/')
+                subdir = head.partition('/')[2]
+                in_egg_info = subdir.endswith('.egg-info') and '/' not in subdir
+                if sep and (tail in _egg_info_files and in_egg_info if subdir else tail in _metadata_files):
+                    tf.extract(member, self.tempdir)
         try:
             self.root = next(self.tempdir.glob('*/PKG-INFO')).parent
         except StopIteration:
@@ -101,7 +213,22 @@ class RPM:
         if not hasattr(self, 'tempdir') or not self.source:
             return
 
-        with tarfile.open(self.source) as tf:
+        # Prefer the much faster GNU tar, which refuses members that would escape the destination directory. Otherwise,
+        # or if it fails (e.g. a problem with the archive that tarfile will also run into), extract with python.
+        # Files already extracted are skipped.
+        tar_cmd = ['tar', '-x', '--no-same-owner', '--skip-old-files', '-f', str(self.source), '-C', str(self.tempdir)]
+        if _gnu_tar():
+            try:
+                subprocess.run(tar_cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                               encoding='utf-8', errors='replace')
+                return
+            except OSError as err:
+                print(f'WARNING Could not run tar, extracting with python instead: {err}', file=sys.stderr)
+            except subprocess.CalledProcessError as err:
+                print(f'WARNING tar returned {err.returncode}, extracting with python instead:', file=sys.stderr)
+                print(err.stderr, file=sys.stderr)
+
+        with tarfile.open(self.source, copybufsize=_tar_bufsize) as tf:
             # Only extract files that will resolve within the destination directory − also skip existing files
             tempdir = self.tempdir.resolve()
             safe_members = [info for info, dest in ((info, (tempdir / info.name).resolve()) for info in tf.getmembers())
@@ -112,20 +239,22 @@ class RPM:
     def _make_directories(self):
         """ Ensure the necessary directories exist """
         self.dest_dir.mkdir(parents=True, exist_ok=True)
-        if self.config.getboolean('pysrpm', 'spec_only'):
+        if self.options['spec_only']:
             return
 
-        for d in ('SOURCES', 'SPECS', 'BUILD', 'RPMS', 'SRPMS'):
-            self.rpm_base.joinpath(d).mkdir(parents=True, exist_ok=True)
+        # Only the build directory may need missing parents, not its subdirectories
+        self.rpm_base.mkdir(parents=True, exist_ok=True)
+        for d in self.rpm_dirs.values():
+            d.mkdir(exist_ok=True)
 
 
     def __exit__(self, exc_type, exc_value, traceback):
         """ Cleanup any temporary directories and files we extracted """
-        if not self.config.getboolean('pysrpm', 'keep_temp') and not self.config.getboolean('pysrpm', 'spec_only'):
-            try:
+        try:
+            if not self.options['keep_temp'] and not self.options['spec_only']:
                 shutil.rmtree(self.rpm_base, ignore_errors=True)
-            except AttributeError:
-                pass  # Early exit? load_configuration() did not finish
+        except AttributeError:
+            pass  # Early exit? load_configuration() did not finish
 
         try:
             shutil.rmtree(self.tempdir)
@@ -161,17 +290,29 @@ class RPM:
             '__templates__': {opt: arg for opt, arg in self.cli_templates.items()},
         }, source='CLI')
 
+        # Options are final from here on: interpolate them once, and convert flags to booleans
+        self.options = {opt: self.config.getboolean('pysrpm', opt) if opt in _boolean_options
+                        else self.config.get('pysrpm', opt) for opt in self.config.options('pysrpm')}
+
         # Set config params from loaded config
-        self.dest_dir = pathlib.Path(self.config.get('pysrpm', 'dest_dir'))
-        self.rpm_base = pathlib.Path(self.config.get('pysrpm', 'rpm_base'))
+        self.dest_dir = pathlib.Path(self.options['dest_dir'])
+        self.rpm_base = pathlib.Path(self.options['rpm_base'])
+        if self.build_subdir is not None:
+            self.rpm_base = self.rpm_base / self.build_subdir
+        self.rpm_topdir = self.rpm_base.resolve()
+        self.rpm_dirs = {d: self.rpm_base / d for d in _rpm_build_subdirs}
 
         # Inherit from parent sections by copying raw templates down, which allows the interpolations to be re-evaluated
-        self.config.set('__templates__', 'inherits', self.config.get('pysrpm', 'flavour', fallback='base'))
-        for section in self.config.sections():
-            if section in ['base', 'pysrpm']:
-                continue
-
-            parent = self.config.get(section, 'inherits', fallback='base')
+        # Only the selected flavour’s ancestry is needed: walk it up to base, then copy templates down from the top.
+        self.config.set('__templates__', 'inherits', self.options.get('flavour', 'base'))
+        ancestry = ['__templates__']
+        while ancestry[-1] != 'base':
+            parent = self.config.get(ancestry[-1], 'inherits', fallback='base')
+            if parent in ancestry:
+                raise ValueError(f'Circular flavour inheritance: {" -> ".join([*ancestry[1:], parent])}')
+            ancestry.append(parent)
+
+        for section, parent in reversed(list(zip(ancestry, ancestry[1:]))):
             self.config.read_dict({section: {key: value for key, value in self.config.items(parent, raw=True) if not
                                              self.config.has_option(section, key)}}, 'inherited')
 
@@ -182,23 +323,55 @@ class RPM:
         self.environments = {key.strip(): val.strip() for key, val in env_markers}
 
         # Extract additional files if required to get the package metadata
-        if self.config.getboolean('pysrpm', 'extract_dependencies'):
+        if self.options['extract_dependencies']:
             self.full_extraction()
 
 
-    @functools.cache
     @staticmethod
     def load_toml_config(path):
-        """ Load a TOML file
+        """ Load a TOML file, reusing the previous parse as long as the file is not modified
 
         Args:
             path (`str` or path-like): Path to a toml file to load
 
         Returns:
-            `dict` or `None`: A dictionary of file contents
+            `dict`: A dictionary of file contents, which must not be modified
         """
+        stat = os.stat(path)
+        return RPM._parse_toml_config(path, stat.st_mtime_ns, stat.st_size)
+
+
+    @functools.cache
+    @staticmethod
+    def _parse_toml_config(path, mtime, size):
+        """ Parse a TOML file, cached by path, modification time and size (see :meth:`~load_toml_config`) """
         with open(path, 'rb') as f:
-            return tomli.load(f)
+            return tomllib.load(f)
+
+
+    @staticmethod
+    def load_ini_config(path, from_project=False):
+        """ Load an INI file, reusing the previous parse as long as the file is not modified
+
+        Args:
+            path (`str` or path-like): Path to a configuration file to load
+            from_project (`bool`): Whether to evaluate the file’s own interpolations, as for a project’s setup.cfg
+
+        Returns:
+            :class:`~configparser.RawConfigParser`: The parsed file, which must not be modified. Interpolations are
+                                                    evaluated when reading its values.
+        """
+        stat = os.stat(path)
+        return RPM._parse_ini_config(path, from_project, stat.st_mtime_ns, stat.st_size)
+
+
+    @functools.cache
+    @staticmethod
+    def _parse_ini_config(path, from_project, mtime, size):
+        """ Parse an INI file, cached by path, modification time and size (see :meth:`~load_ini_config`) """
+        parser = configparser.ConfigParser() if from_project else configparser.RawConfigParser()
+        parser.read(path)
+        return parser
 
 
     def load_user_config(self, path, from_project=False):
@@ -212,19 +385,39 @@ class RPM:
             `dict` or `None`: A dictionary of section name to section template
         """
         if pathlib.Path(path).suffix == '.toml':
-            config = RPM.load_toml_config(path).get('tool', {}).get('pysrpm', {})
-            # Move anything directy under 'pysrpm' into a nested table
-            config['pysrpm'] = {key: config.pop(key) for key, value in config.copy().items() if type(value) is not dict}
+            # Move anything directy under 'pysrpm' into a nested table, without modifying the cached toml contents
+            toml_config = RPM.load_toml_config(path).get('tool', {}).get('pysrpm', {})
+            config = {key: value for key, value in toml_config.items() if type(value) is dict}
+            config['pysrpm'] = {key: value for key, value in toml_config.items() if type(value) is not dict}
         else:
-            parser = configparser.ConfigParser() if from_project else configparser.RawConfigParser()
-            parser.read(path)
-            prefix = 'pysrpm.' if any(section.startswith('pysrpm.') for section in parser.sections()) else ''
-            config = {cfgsec.replace(prefix, ''): dict(parser.items(cfgsec)) for cfgsec in parser.sections()
-                      if cfgsec.startswith(prefix) or cfgsec == 'pysrpm'}
+            # Only evaluate interpolations in the sections that are used, others may not be valid for our parser
+            parser = RPM.load_ini_config(path, from_project)
+            config = {section: dict(parser.items(cfgsec)) for section, cfgsec in
+                      RPM._config_sections(parser.sections()).items()}
 
         self.config.read_dict(config, source=path)
 
 
+    @staticmethod
+    def _config_sections(sections):
+        """ Select the pysrpm sections from an INI file’s sections
+
+        If any section is named `[pysrpm.<name>]`, as in a project’s shared setup.cfg, only `[pysrpm]` and those
+        sections are used, named `<name>`. Otherwise all sections are used as is.
+
+        Args:
+            sections (`list` of `str`): The names of the INI file’s sections
+
+        Returns:
+            `dict`: A dictionary of section names to load in the RPM’s config, to the INI file’s section names
+        """
+        if not any(section.startswith('pysrpm.') for section in sections):
+            return {section: section for section in sections}
+
+        return {cfgsec[len('pysrpm.'):] if cfgsec != 'pysrpm' else cfgsec: cfgsec
+                for cfgsec in sections if cfgsec.startswith('pysrpm.') or cfgsec == 'pysrpm'}
+
+
     def load_source_metadata(self, root, with_deps=False):
         """ Extract package metadata from a python source package
 
@@ -232,8 +425,10 @@ class RPM:
         but it’s unfortunately incomplete, see e.g. https://github.com/pypa/setuptools/issues/1716
 
         So in order to be as compliant as possible with any future build system enabled by pep517, just extract
-        the full tarball and get the metadata from pep517.meta. This is of course much slower, as we extract the full
-        package and the pep517 package ensures backends are installed, etc.
+        the full tarball and get the metadata from the pep517 backend. This is of course much slower, as we extract the
+        full package, and backends are installed in an isolated environment if missing, etc. That is skipped for
+        setuptools sdists with PKG-INFO metadata version 2.2 or newer, where non-dynamic dependencies are reliable
+        (PEP 643).
 
         Args:
             root (:class:`~pathlib.Path`): Path to a directory containing source distribution of the package
@@ -252,21 +447,32 @@ class RPM:
             except StopIteration:
                 pass
 
-        if with_deps or not pkg_info.exists():
-            self.full_extraction()  # May be needed?
-            dist = pep517.meta.load(root)
-            dist_meta = dist.metadata
-            entry_points = dist.entry_points
-        else:
-            # Metadata from importlib.metadata is an email.Message, so do the same here
+        # setuptools sdists ship an egg-info directory, which has the entry points that PKG-INFO lacks
+        egg_info = next(root.glob('*.egg-info'), None)
+
+        dist_meta = None
+        if pkg_info.exists():
+            # Metadata from importlib.metadata is an email.Message, so do the same here. The body is the long
+            # description, which is kept verbatim rather than parsed as MIME.
             with open(pkg_info, 'rb') as f:
-                dist_meta = email.message_from_binary_file(f)
+                dist_meta = email.parser.BytesParser().parse(f, headersonly=True)
             dist_meta.set_param('charset', 'utf8')
 
-            # May not exist, only when egg-info is built (wheels, setuptools develop installs…)
-            ep_parser = configparser.ConfigParser()
+            # Even when we need dependencies, avoid building metadata if the dependencies in an sdist’s PKG-INFO can be
+            # trusted. A source directory’s egg-info may be left over from any previous build, so it proves nothing.
+            from_sdist = self.source is not None and pkg_info == root / 'PKG-INFO' and egg_info is not None
+            if with_deps and not (from_sdist and RPM._has_static_dependencies(dist_meta)):
+                dist_meta = None
+
+        if dist_meta is None:
+            self.full_extraction()  # May be needed?
+            dist_meta, entry_points = RPM._build_metadata(root)
+        else:
+            # May not exist, only when egg-info is built (sdists, wheels, setuptools develop installs…)
+            ep_parser = configparser.RawConfigParser()
+            ep_parser.optionxform = str
             try:
-                ep_parser.read_file([str(root / 'entry_points.txt')])
+                ep_parser.read([root / 'entry_points.txt', *([egg_info / 'entry_points.txt'] if egg_info else [])])
             except configparser.MissingSectionHeaderError:
                 pass
             entry_points = [importlib_metadata.EntryPoint(key, value, sec) for sec in ep_parser.sections()
@@ -284,11 +490,11 @@ class RPM:
 
         enabled_entry_points = []
         disabled_entry_points = []
-        extra_patterns = self.templates['requires_extras'].split() + self.templates['suggests_extras'].split()
+        extra_patterns = _compile_patterns(f"{self.templates['requires_extras']} {self.templates['suggests_extras']}")
         for ep in entry_points:
             extras = re.match(r'.* \[(.+)\]$', ep.value.strip())
             for extra in ((extra.strip() for extra in extras.group(1).split(',')) if extras else []):
-                if not any(fnmatch.fnmatch(extra, pattern) for pattern in extra_patterns):
+                if not extra_patterns.match(extra):
                     # A specified extra on the entry point is not matching any of the extras included in the package
                     disabled_entry_points.append(f'"{ep.name}"' if ' ' in ep.name else ep.name)
                     break
@@ -311,26 +517,97 @@ class RPM:
         multiple_use = {'dynamic', 'platform', 'supported-platform', 'classifier', 'requires-dist',
                         'requires-external', 'project-url', 'provides-extra', 'provides-dist', 'obsoletes-dist'}
 
-        for key, value in ((key.lower(), value.replace('%', '%%')) for key, value in dist_meta.items()):
-            if key == 'content-type':
-                continue
-            elif key in multiple_use:
-                metadata.setdefault(key, []).append(value)
-            else:
-                metadata[key] = f'{metadata[key]} {value}' if key in metadata else value
+        # Collect all values per key, then keep lists for multiple-use fields and join the others
+        fields = defaultdict(list)
+        for key, value in dist_meta.items():
+            fields[key.lower()].append(value.replace('%', '%%'))
+        fields.pop('content-type', None)
+        metadata.update((key, values if key in multiple_use else ' '.join(values)) for key, values in fields.items())
 
         epoch, rpmversion = python_version_to_rpm_version(metadata['version']).rpartition(':')[::2]
         return {
             **metadata,
             'rpmname': self.templates['python_package'].format(name=re.sub('[._-]+', '-', metadata['name'].lower())),
             'rpmversion': rpmversion,
-            'release': self.config.get('pysrpm', 'release'),
+            'release': self.options['release'],
             'arch': self.templates['arch'],
-            'sourcefile': self.templates['source_name'].format(**metadata),
+            'sourcefile': self.templates['source_name'].format_map(metadata),
             **({'epoch': epoch} if epoch != '' else {}),
         }
 
 
+    @staticmethod
+    def _is_installed(req):
+        """ Check whether a requirement is satisfied in the running python environment
+
+        Args:
+            req (`str`): The string representation of a python dependency
+
+        Returns:
+            `bool`: `True` iff the requirement is not needed here or an installed distribution satisfies it
+        """
+        req = _parse_requirement(req)
+        if req.marker is not None and not req.marker.evaluate():
+            return True
+
+        try:
+            version = importlib_metadata.version(req.name)
+        except importlib_metadata.PackageNotFoundError:
+            return False
+        return req.specifier.contains(version, prereleases=True)
+
+
+    @staticmethod
+    def _build_metadata(root):
+        """ Build the metadata of a source package with its PEP 517 backend
+
+        If the backend and its requirements are already installed, call its hooks with the running python, otherwise
+        let :func:`pep517.meta.load` create an isolated build environment and install them there (which is slow).
+
+        Args:
+            root (:class:`~pathlib.Path`): Path to a directory containing the full source of the package
+
+        Returns:
+            `tuple`: The metadata as a :class:`~email.message.Message` and the list of entry points
+        """
+        system = pep517.build.compat_system(str(root))
+        if all(RPM._is_installed(req) for req in system['requires']):
+            hooks = pep517.wrappers.Pep517HookCaller(str(root), system['build-backend'], system.get('backend-path'))
+            with hooks.subprocess_runner(pep517.wrappers.quiet_subprocess_runner):
+                if all(RPM._is_installed(req) for req in hooks.get_requires_for_build_wheel({})):
+                    with tempfile.TemporaryDirectory() as tempdir:
+                        dist_info = pathlib.Path(tempdir) / hooks.prepare_metadata_for_build_wheel(tempdir, {})
+                        dist = importlib_metadata.PathDistribution(dist_info)
+                        return dist.metadata, list(dist.entry_points)
+
+        # Only needed as a fallback, and it imports the isolated build environment machinery
+        from pep517 import meta as pep517_meta
+        dist = pep517_meta.load(root)
+        return dist.metadata, dist.entry_points
+
+
+    @staticmethod
+    def _has_static_dependencies(dist_meta):
+        """ Check whether the dependencies listed in a source distribution’s PKG-INFO are final
+
+        Per PEP 643, from metadata version 2.2 any field not marked as dynamic must be identical in built distributions.
+
+        Args:
+            dist_meta (:class:`~email.message.Message`): The contents of the PKG-INFO file
+
+        Returns:
+            `bool`: `True` iff the dependencies and extras can be used without building the metadata
+        """
+        try:
+            if Version(dist_meta.get('Metadata-Version', '1.0')) < Version('2.2'):
+                return False
+        except InvalidVersion:
+            return False
+
+        dynamic = {field.lower() for field in dist_meta.get_all('Dynamic', [])}
+        return not dynamic & {'requires-dist', 'provides-extra'}
+
+
     def convert_python_req(self, reqs, extras=[], package_template='python_dist'):
         """ Compute the version-specified dependency list for a package
 
@@ -344,7 +621,7 @@ class RPM:
         """
         rpm_reqs = []
         environments = {**self.environments, 'extra': extras}
-        for req in (Requirement(req) for req in reqs):
+        for req in (_parse_requirement(req) for req in reqs):
             condition = simplify_marker_to_rpm_condition(req.marker, environments, self.templates)
             if condition is False:
                 continue
@@ -360,24 +637,36 @@ class RPM:
         return rpm_reqs
 
 
-    def _format_lines(self, template, **kwargs):
+    def _format_lines(self, template, values):
         """ Split a template into lines and .format() them, returning a list of successfully formatted lines
 
         Lines with missing keys are removed, unless the keys are not marked optional in which case a KeyError is raised.
 
         Args:
             template (`str`): The template of a spec file section
+            values (`dict`): The values to interpolate in the template
 
         Returns:
             `list`: the successfully formatted lines
         """
+        lines = _template_lines(template)
+        missing = frozenset().union(*(fields for _, fields in lines)) - values.keys()
+        if not missing <= self.templates['optional_keys']:
+            raise KeyError(f'Missing template key(s) {", ".join(sorted(missing - self.templates["optional_keys"]))}')
+
+        # Common case where no key is missing: format the whole template at once
+        if not missing:
+            try:
+                return template.format_map(values).split('\n')
+            except ValueError:
+                pass  # Format line by line to report the offending line
+
         successful_lines = []
-        for line in template.split('\n'):
+        for line, fields in lines:
+            if fields & missing:
+                continue
             try:
-                successful_lines.append(line.format(**kwargs))
-            except KeyError as err:
-                if not set(err.args) <= self.templates['optional_keys']:
-                    raise KeyError(f'Missing template key(s) {", ".join(err.args)}') from err
+                successful_lines.append(line.format_map(values))
             except ValueError as err:
                 raise ValueError(f'Error formatting line: {line}') from err
         return successful_lines
@@ -392,21 +681,19 @@ class RPM:
         Returns:
             `str`: the contents of the spec file
         """
-        spec = self._format_lines(self.templates['preamble'].lstrip('\n'), **pkg_info)
+        spec = self._format_lines(self.templates['preamble'].lstrip('\n'), pkg_info)
         # In BuildRequires, python3 is not yet installed, ensure we do not need its version macro by using a template
         # that is not python-version dependent (as python_dist is). RPM should figure out what to do regardless.
         spec.append('BuildRequires: ' + ', '.join(self.convert_python_req(pkg_info['build-requires'],
                                                                           package_template='python_package')))
 
         # Handle automatically extracting dependencies
-        extract_deps = self.config.getboolean('pysrpm', 'extract_dependencies')
+        extract_deps = self.options['extract_dependencies']
         deps = pkg_info.get('requires-dist', []) if extract_deps else []
         extras = pkg_info.get('provides-extra', []) if extract_deps else []
 
-        requires_extras = {match for pattern in self.templates['requires_extras'].split()
-                           for match in fnmatch.filter(extras, pattern)}
-        suggests_extras = {match for pattern in self.templates['suggests_extras'].split()
-                           for match in fnmatch.filter(extras, pattern)}
+        requires_extras = set(filter(_compile_patterns(self.templates['requires_extras']).match, extras))
+        suggests_extras = set(filter(_compile_patterns(self.templates['suggests_extras']).match, extras))
 
         # Generate required dependencies
         required = self.templates['requires'].replace('\n', ' ')
@@ -427,7 +714,7 @@ class RPM:
         # Generate the rest of the file
         sections = self.config.options('base')
         for section in sections[sections.index('preamble') + 1:]:
-            section_spec = self._format_lines(self.templates[section], **pkg_info)
+            section_spec = self._format_lines(self.templates[section], pkg_info)
             if any(section_spec):
                 spec.extend(['', f'%{section}{" " if section_spec[0] else ""}{section_spec[0]}', *section_spec[1:]])
 
@@ -445,26 +732,93 @@ class RPM:
             dest = dest / orig.name
         if dest.exists():
             dest.unlink()
+
         try:
             os.link(orig, dest)
-        except Exception:
-            shutil.copy2(orig, dest)
+            return
+        except OSError as err:
+            if err.errno not in _link_fallback_errnos:
+                raise
+
+        # Copies the contents in-kernel where possible (sendfile on linux, fcopyfile on macOS)
+        shutil.copy2(orig, dest)
+
+
+    @staticmethod
+    def _static_binary_rpms(spec):
+        """ Compute the binary rpm path from the spec preamble, if it does not require rpm to evaluate anything
+
+        Args:
+            spec (`str`): the contents of the spec file
+
+        Returns:
+            `list` or `None`: the path of the single binary rpm relative to the RPMS directory, or `None` if the spec
+                              defines subpackages, or relies on macros or missing tags for the rpm file name
+        """
+        if re.search(r'^%package\b', spec, re.MULTILINE):
+            return None
+
+        preamble = spec.split('\n\n%', 1)[0].split('\n')
+        if any(line.startswith('%') for line in preamble):
+            return None  # Conditionals or macro definitions
+
+        tags = {tag.strip().lower(): value.strip()
+                for tag, value in (line.split(':', 1) for line in preamble if ':' in line)}
+        fields = [tags.get(tag) for tag in ('name', 'version', 'release', 'buildarch')]
+        if not all(fields) or any('%' in field for field in fields):
+            return None
+
+        name, version, release, arch = fields
+        return [pathlib.Path(f'{arch}/{name}-{version}-{release}.{arch}.rpm')]
+
+
+    def _query_binary_rpms(self, spec_file):
+        """ Ask rpm which binary rpms will be built from a spec file
+
+        Args:
+            spec_file (:class:`~pathlib.Path`): the spec file
+
+        Returns:
+            `list`: the paths of the binary rpms relative to the RPMS directory
+        """
+        query_format = r'%{arch}/%{name}-%{version}-%{release}.%{arch}.rpm\n'
+        if librpm is not None:
+            # Parse the spec in-process rather than spawning rpm
+            try:
+                query_output = ''.join(pkg.header.format(query_format) for pkg in librpm.spec(str(spec_file)).packages)
+            except ValueError as err:
+                raise RPMBuildError('rpm querying of specfile failed') from err
+        else:
+            query = ['rpm', '-q', '--qf', query_format, '--specfile', str(spec_file)]
+            try:
+                query_output = subprocess.run(query, capture_output=True, encoding='utf-8', check=True).stdout
+            except subprocess.CalledProcessError as err:
+                print(f'ERROR The command returned {err.returncode}:', ' '.join(
+                    arg if ' ' not in arg else f"'{arg}'" if "'" not in arg else f'"{arg}"' for arg in query
+                ), file=sys.stderr)
+                print(err.stderr, file=sys.stderr)
+                raise RPMBuildError('rpm querying of specfile failed') from err
+        return [pathlib.Path(out) for out in query_output.strip().split('\n')]
 
 
     def run(self):
         """ Create the requested files: either spec, source RPM, and/or binary RPM """
         self.load_configuration()
-        pkg_info = self.load_source_metadata(self.root, self.config.getboolean('pysrpm', 'extract_dependencies'))
-
-        # Start by building the spec
-        spec = self.make_spec(pkg_info)
 
-        dry_run = self.config.getboolean('pysrpm', 'dry_run')
+        options = self.options
+        dry_run = options['dry_run']
+        keep_temp = options['keep_temp']
+        icon = options.get('icon')
         # Priority of options: if spec_only is set the other 2 are ignored,
         # if binary_only then source_only (which is set by default) is ignored
-        spec_only = self.config.getboolean('pysrpm', 'spec_only')
-        binary_only = self.config.getboolean('pysrpm', 'binary_only')
-        source_only = self.config.getboolean('pysrpm', 'source_only')
+        spec_only = options['spec_only']
+        binary_only = options['binary_only']
+        source_only = options['source_only']
+
+        pkg_info = self.load_source_metadata(self.root, options['extract_dependencies'])
+
+        # Start by building the spec
+        spec = self.make_spec(pkg_info)
 
         if spec_only and dry_run:
             print(spec)
@@ -472,63 +826,55 @@ class RPM:
 
         self._make_directories()
 
-        spec_file = (self.dest_dir if spec_only else self.rpm_base / 'SPECS') / f'{pkg_info["rpmname"]}.spec'
-        with open(spec_file, 'w') as f:
-            print(spec, file=f)
+        spec_file = (self.dest_dir if spec_only else self.rpm_dirs['SPECS']) / f'{pkg_info["rpmname"]}.spec'
+        spec_file.write_text(spec + '\n', encoding='utf-8')
 
         if spec_only:
             print(spec_file)
             return
 
         # Determine the binary and source rpm names that should be built out of this spec file
-        query = [*r'rpm -q --qf %{arch}/%{name}-%{version}-%{release}.%{arch}.rpm\n --specfile'.split(), str(spec_file)]
-        try:
-            query_output = subprocess.run(query, capture_output=True, encoding='utf-8', check=True).stdout
-        except subprocess.CalledProcessError as err:
-            print(f'ERROR The command returned {err.returncode}:', ' '.join(
-                arg if ' ' not in arg else f"'{arg}'" if "'" not in arg else f'"{arg}"' for arg in query
-            ), file=sys.stderr)
-            print(err.stderr, file=sys.stderr)
-            raise RPMBuildError('rpm querying of specfile failed') from err
-        binary_rpms = [pathlib.Path(out) for out in query_output.strip().split('\n')]
+        binary_rpms = self._static_binary_rpms(spec) or self._query_binary_rpms(spec_file)
         source_rpm = pathlib.Path(binary_rpms[0].stem).with_suffix('.src.rpm')
 
         # Make a source distribution and copy to SOURCES directory with optional icon.
         if self.source is not None:
-            self._copy(self.source, self.rpm_base / 'SOURCES' / pkg_info['sourcefile'])
+            self._copy(self.source, self.rpm_dirs['SOURCES'] / pkg_info['sourcefile'])
         else:
             # Unclear whether this is deprecated − it seems not, just the CLI
-            pep517.build.build(self.root, 'sdist', self.rpm_base / 'SOURCES', system=self.build_system)
+            pep517.build.build(self.root, 'sdist', self.rpm_dirs['SOURCES'], system=self.build_system)
 
-        icon = self.config.get('pysrpm', 'icon', fallback=None)
         if icon:
             icon = pathlib.Path(icon)
             if not icon.exists():
                 raise FileNotFoundError(str(icon))
-            self._copy(self.icon, self.rpm_base / 'SOURCES' / icon.name)
+            self._copy(icon, self.rpm_dirs['SOURCES'] / icon.name)
 
         # Construct the rpmbuild command
         rpm_cmd = ['rpmbuild', '-bb' if binary_only else '-bs' if source_only else '-ba',
-                   '--define', f'_topdir {self.rpm_base.resolve()}',
+                   '--define', f'_topdir {self.rpm_topdir}',
                    '--define', f'__python {self.templates["python"]}',
                    str(spec_file)]
 
-        if not self.config.getboolean('pysrpm', 'keep_temp'):
+        if not keep_temp:
             rpm_cmd.insert(-1, '--clean')
 
-        # Run rpmbuild
-        try:
-            subprocess.run(rpm_cmd, check=True, encoding='utf-8', capture_output=True)
-        except subprocess.CalledProcessError as err:
-            print(f'ERROR The command returned {err.returncode}:', ' '.join(
-                arg if ' ' not in arg else f"'{arg}'" if "'" not in arg else f'"{arg}"' for arg in rpm_cmd
-            ), file=sys.stderr)
-            print(err.stderr, file=sys.stderr)
-            raise RPMBuildError('rpmbuild command failed') from err
+        # Run rpmbuild, only keeping stderr for error reporting as build logs on stdout can be large. Spool stderr to a
+        # file, which is only read on failure, rather than reading it through a pipe.
+        with tempfile.TemporaryFile() as errors:
+            try:
+                subprocess.run(rpm_cmd, check=True, stdout=subprocess.DEVNULL, stderr=errors)
+            except subprocess.CalledProcessError as err:
+                print(f'ERROR The command returned {err.returncode}:', ' '.join(
+                    arg if ' ' not in arg else f"'{arg}'" if "'" not in arg else f'"{arg}"' for arg in rpm_cmd
+                ), file=sys.stderr)
+                errors.seek(0)
+                print(errors.read().decode('utf-8', errors='replace'), file=sys.stderr)
+                raise RPMBuildError('rpmbuild command failed') from err
 
         # Replace target files only if we don’t dry run − check files are generated in any case
         if not binary_only:
-            srpm = self.rpm_base / 'SRPMS' / source_rpm
+            srpm = self.rpm_dirs['SRPMS'] / source_rpm
             if not srpm.exists():
                 raise RPMBuildError('Expected source rpm not found')
             if not dry_run:
@@ -536,11 +882,57 @@ class RPM:
                 print(self.dest_dir / source_rpm.name)
 
         if binary_only or not source_only:
-            if not any((self.rpm_base / 'RPMS' / rpm).exists() for rpm in binary_rpms):
+            if not any((self.rpm_dirs['RPMS'] / rpm).exists() for rpm in binary_rpms):
                 raise RPMBuildError('No binary rpm found, expected at least one')
 
             for rpm in binary_rpms:
-                rpm = self.rpm_base / 'RPMS' / rpm
+                rpm = self.rpm_dirs['RPMS'] / rpm
                 if rpm.exists() and not dry_run:
                     rpm.replace(self.dest_dir / rpm.name)
                     print(self.dest_dir / rpm.name)
+
+
+    @classmethod
+    def _run_one(cls, source, **kwargs):
+        """ Convert a single source, as a classmethod so it can be dispatched to worker processes
+
+        Args:
+            source (`str` or path-like): the source package to convert
+            kwargs: the arguments to build the :class:`~RPM` with
+
+        Returns:
+            :class:`~pathlib.Path` or `None`: the build directory, if it was removed after the conversion
+        """
+        with cls(source, **kwargs) as rpm_builder:
+            rpm_builder.run()
+
+        options = rpm_builder.options
+        return None if options['keep_temp'] or options['spec_only'] else rpm_builder.rpm_base
+
+
+    @classmethod
+    def run_many(cls, sources, jobs=1, **kwargs):
+        """ Convert several sources, running up to jobs conversions in parallel worker processes
+
+        rpmbuild is the bottleneck and runs in a subprocess, so conversions are independent except for the build
+        directory: each parallel conversion builds in its own subdirectory of it. Once all are done, the build directory
+        is removed if it is left empty, as it is for a single conversion.
+
+        Args:
+            sources (`list` of `str` or path-like): the source packages to convert
+            jobs (`int`): the maximum number of source packages to convert in parallel, or `None` for one per CPU
+            kwargs: the arguments to build each :class:`~RPM` with
+        """
+        if jobs == 1 or len(sources) <= 1:
+            for source in sources:
+                cls._run_one(source, **kwargs)
+            return
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(jobs or os.cpu_count(), len(sources))) as executor:
+            futures = [executor.submit(cls._run_one, source, **kwargs, build_subdir=f'job-{num}')
+                       for num, source in enumerate(sources)]
+            build_dirs = [future.result() for future in futures]
+
+        for build_dir in {build_dir.parent for build_dir in build_dirs if build_dir is not None}:
+            with contextlib.suppress(OSError):
+                build_dir.rmdir()
@@ -0,0 +1,55 @@
+import email
+import pytest
+import unittest.mock
+
+import pysrpm.rpm
+
+
+# Mock distribution metadata, update with:
+# python3 -c 'from pep517.meta import load; print(load("setupcfg_package").metadata)'
+METADATA_TEXT = '''Metadata-Version: 2.1
+Name: package
+Version: 0.0.0
+Summary: A sample package
+Home-page: https://sample-package.github.io
+Author: Cimbali
+Author-email: me@cimba.li
+License: UNKNOWN
+Keywords: test,hello world,sample,packaging
+Platform: UNKNOWN
+Classifier: Development Status :: 4 - Beta
+Classifier: Programming Language :: Python
+Requires-Dist: pyparsing (!=2.0.4,!=2.1.2,!=2.1.6,>=2.0.1)
+Requires-Dist: babel (!=2.0,>=1.3)
+Requires-Dist: pbr (!=2.1.0,>=2.0.0)
+Requires-Dist: foo ; os_name != "nt" and implementation_name == "cython"
+Requires-Dist: win32 ; os_name == "nt"
+Requires-Dist: bar ; platform_machine != "x86" and platform_release > "5.14"
+Requires-Dist: enum34 ; python_version < "3.4"
+Provides-Extra: test
+Requires-Dist: pytest (~=5.0) ; extra == 'test'
+
+Hello world from a sample package?
+'''
+
+
+@pytest.fixture(scope='session')
+def mock_dist():
+    dist = unittest.mock.Mock()
+    dist.metadata = email.message_from_string(METADATA_TEXT)
+    dist.entry_points = []
+    return dist
+
+
+@pytest.fixture(scope='session')
+def pkg_info_text():
+    """ The mock distribution’s metadata as the contents of a PKG-INFO file """
+    return METADATA_TEXT
+
+
+@pytest.fixture(autouse=True)
+def build_metadata(monkeypatch, mock_dist):
+    """ Never build metadata with the package’s backend, return the mock distribution’s instead """
+    build_metadata = unittest.mock.Mock(return_value=(mock_dist.metadata, mock_dist.entry_points))
+    monkeypatch.setattr(pysrpm.rpm.RPM, '_build_metadata', build_metadata)
+    return build_metadata
@@ -5,8 +5,8 @@ from pysrpm.convert import _single_marker_to_rpm_condition, simplify_marker_to_r
 from pysrpm.convert import python_version_to_rpm_version
 import pysrpm.rpm
 
-import sys
 import rpm
+import pytest
 import pathlib
 
 TEMPLATES = {
@@ -35,17 +35,20 @@ def complex_marker(text, extras=[]):
 def version(text):
     return specifier_to_rpm_version('package', SpecifierSet(text))
 
-def multiple_requirements(texts, extras=[]):
-    with pysrpm.rpm.RPM(pathlib.Path(__file__).parent / 'setupcfg_package') as rpm:
-        rpm.environments = ENVIRONMENT
-        rpm.templates = TEMPLATES
+@pytest.fixture(scope='module')
+def rpm_builder():
+    with pysrpm.rpm.RPM(pathlib.Path(__file__).parent / 'setupcfg_package') as rpm_builder:
+        rpm_builder.environments = ENVIRONMENT
+        rpm_builder.templates = TEMPLATES
+        yield rpm_builder
 
-        converted = rpm.convert_python_req(texts, extras=extras)
-        assert len(converted) <= 1
-        return set().union(*(set(req.split(', ')) for req in converted))
+def multiple_requirements(rpm_builder, texts, extras=[]):
+    converted = rpm_builder.convert_python_req(texts, extras=extras)
+    assert len(converted) <= 1
+    return set().union(*(set(req.split(', ')) for req in converted))
 
-def single_requirement(text, extras=[]):
-    return multiple_requirements([text], extras=extras)
+def single_requirement(rpm_builder, text, extras=[]):
+    return multiple_requirements(rpm_builder, [text], extras=extras)
 
 class RPMVersion:
     def __init__(self, verstring):
@@ -113,16 +116,16 @@ def test_version_comparison():
     assert version('!= 1.5.*') == 'package < 1.5 or package > 1.5'
 
 
-def test_full_requirement_conversion():
-    assert single_requirement('package (!=2.0.4,!=2.1.2,!=2.1.6,>=2.0.1)') == {
+def test_full_requirement_conversion(rpm_builder):
+    assert single_requirement(rpm_builder, 'package (!=2.0.4,!=2.1.2,!=2.1.6,>=2.0.1)') == {
             'python-package < 2.1.6 or python-package > 2.1.6', 'python-package < 2.0.4 or python-package > 2.0.4',
             'python-package < 2.1.2 or python-package > 2.1.2', 'python-package >= 2.0.1',
     }
-    assert single_requirement('package (!=2.0,>=1.3)') == {'python-package < 2.0 or python-package > 2.0', 'python-package >= 1.3'}
-    assert single_requirement('package (!=2.1.0,>=2.0.0)') == {'python-package >= 2.0.0', 'python-package < 2.1.0 or python-package > 2.1.0'}
-    assert single_requirement('package ; os_name == "nt"') == set()
-    assert single_requirement('package ; os_name != "nt" and implementation_name == "cpython"') == {'python-package'}
-    assert single_requirement('package ; platform_machine != "x86" and platform_release > "5.14"') == {'python-package without python(x86) with kernel > 5.14'}
-    assert single_requirement('package (~=5.0) ; extra == "test"') == set()
-    assert single_requirement('package (~=5.0) ; extra == "test"', extras=['test']) == {'python-package >= 5.0', 'python-package < 6'}
-    assert single_requirement('package == 5.* ; python_version < "3.4"') == {'python-package = 5 with python(abi) < 3.4'}
+    assert single_requirement(rpm_builder, 'package (!=2.0,>=1.3)') == {'python-package < 2.0 or python-package > 2.0', 'python-package >= 1.3'}
+    assert single_requirement(rpm_builder, 'package (!=2.1.0,>=2.0.0)') == {'python-package >= 2.0.0', 'python-package < 2.1.0 or python-package > 2.1.0'}
+    assert single_requirement(rpm_builder, 'package ; os_name == "nt"') == set()
+    assert single_requirement(rpm_builder, 'package ; os_name != "nt" and implementation_name == "cpython"') == {'python-package'}
+    assert single_requirement(rpm_builder, 'package ; platform_machine != "x86" and platform_release > "5.14"') == {'python-package without python(x86) with kernel > 5.14'}
+    assert single_requirement(rpm_builder, 'package (~=5.0) ; extra == "test"') == set()
+    assert single_requirement(rpm_builder, 'package (~=5.0) ; extra == "test"', extras=['test']) == {'python-package >= 5.0', 'python-package < 6'}
+    assert single_requirement(rpm_builder, 'package == 5.* ; python_version < "3.4"') == {'python-package = 5 with python(abi) < 3.4'}
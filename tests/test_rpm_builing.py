@@ -1,11 +1,19 @@
-import pathlib
+import io
+import os
+import errno
 import shutil
-import email
-import copy
+import tarfile
+import contextlib
+import pathlib
 import pytest
+import subprocess
+import pep517.meta
 import unittest.mock
+import concurrent.futures
 
 import pysrpm.rpm
+import pysrpm.__main__
+from click.testing import CliRunner
 
 # Some static elements and mocks
 package_root = pathlib.Path(__file__).parent / 'setupcfg_package'
@@ -13,162 +21,330 @@ package_root = pathlib.Path(__file__).parent / 'setupcfg_package'
 dirs = dict(dest_dir=package_root / 'test-dist', rpm_base=package_root / 'test-build')
 
 
-# Mock distribution metadata, update with:
-# python3 -c 'from pep517.meta import load; print(load("setupcfg_package").metadata)'
-dist = unittest.mock.Mock()
-dist.metadata = email.message_from_string('''Metadata-Version: 2.1
-Name: package
-Version: 0.0.0
-Summary: A sample package
-Home-page: https://sample-package.github.io
-Author: Cimbali
-Author-email: me@cimba.li
-License: UNKNOWN
-Keywords: test,hello world,sample,packaging
-Platform: UNKNOWN
-Classifier: Development Status :: 4 - Beta
-Classifier: Programming Language :: Python
-Requires-Dist: pyparsing (!=2.0.4,!=2.1.2,!=2.1.6,>=2.0.1)
-Requires-Dist: babel (!=2.0,>=1.3)
-Requires-Dist: pbr (!=2.1.0,>=2.0.0)
-Requires-Dist: foo ; os_name != "nt" and implementation_name == "cython"
-Requires-Dist: win32 ; os_name == "nt"
-Requires-Dist: bar ; platform_machine != "x86" and platform_release > "5.14"
-Requires-Dist: enum34 ; python_version < "3.4"
-Provides-Extra: test
-Requires-Dist: pytest (~=5.0) ; extra == 'test'
-
-Hello world from a sample package?
-''')
-dist.entry_points = []
-
-pysrpm.rpm.pep517.meta.load = unittest.mock.Mock()
-pysrpm.rpm.pep517.meta.load.return_value = dist
-
+# The actual metadata building, before the build_metadata fixture mocks it
+build_metadata = pysrpm.rpm.RPM._build_metadata
 
 # Mock output of subprocess.run(['rpm', '-q', ...]): the list of binary rpm packages to be generated
 proc = unittest.mock.Mock()
 proc.stdout = 'noarch/python3-package-0.0.0.noarch.rpm\n'
 
-# Mock output of subprocess.run(...) with file creation side-effect
-def mock_subproc(query, *a, **k):
-    command, opt = query[:2]
-    if command == 'rpm':
-        return proc
-    if command == 'rpmbuild' and opt in ['-bs', '-ba']:
-        with open(dirs['rpm_base'] / 'SRPMS' / 'python3-package-0.0.0.src.rpm', 'wb') as f:
-            pass
-    if command == 'rpmbuild' and opt in ['-bb', '-ba']:
-        binrpm = dirs['rpm_base'] / 'RPMS' / 'noarch' / 'python3-package-0.0.0.noarch.rpm'
-        binrpm.parent.mkdir(parents=True, exist_ok=True)
-        with open(binrpm, 'wb') as f:
-            pass
-    return unittest.mock.Mock()
-
-rpmbuild_args = ['--define', f'_topdir {dirs["rpm_base"].resolve()}',
+# Mock output of subprocess.run(...) with file creation side-effect, in the fake file system
+def mock_subproc(fs):
+    def run(query, *a, **k):
+        command, opt = query[:2]
+        if command == 'rpm':
+            return proc
+        if command == 'rpmbuild' and opt in ['-bs', '-ba']:
+            fs.create_file(dirs['rpm_base'] / 'SRPMS' / 'python3-package-0.0.0.src.rpm')
+        if command == 'rpmbuild' and opt in ['-bb', '-ba']:
+            fs.create_file(dirs['rpm_base'] / 'RPMS' / 'noarch' / 'python3-package-0.0.0.noarch.rpm')
+        return unittest.mock.Mock()
+    return run
+
+# Resolve the build directory on the real file system, once
+_TOPDIR = str(dirs['rpm_base'].resolve())
+rpmbuild_args = ['--define', f'_topdir {_TOPDIR}',
                  '--define', '__python python3', '--clean', f'{dirs["rpm_base"]}/SPECS/python3-package.spec']
-suproc_args = dict(check=True, encoding='utf-8', capture_output=True)
+suproc_args = dict(check=True, stdout=subprocess.DEVNULL, stderr=unittest.mock.ANY)
 
 # Helper functions
-def dir_cleanup(func):
-    """ Dectorator to remove any used directories before and after a test function """
-    def wrapped_func():
-        for dir_ in dirs.values():
-            shutil.rmtree(dir_, ignore_errors=True)
-        try:
-            func()
-        finally:
-            for dir_ in dirs.values():
-                shutil.rmtree(dir_, ignore_errors=True)
-    return wrapped_func
+@pytest.fixture
+def source_fs(fs):
+    """ Fake file system with the real package source and presets, so created files never touch the disk """
+    fs.add_real_directory(package_root, read_only=False)
+    fs.add_real_directory(pathlib.Path(pysrpm.rpm.__file__).parent / 'presets')
+    return fs
+
+@pytest.fixture
+def rpm_commands(monkeypatch):
+    """ Mock the rpm and rpmbuild commands, and sdist building
+
+    Spec files are queried with the (mocked) rpm command even if the rpm python module is installed
+    """
+    run_subproc, build = unittest.mock.Mock(), unittest.mock.Mock()
+    monkeypatch.setattr(pysrpm.rpm.subprocess, 'run', run_subproc)
+    monkeypatch.setattr(pysrpm.rpm.pep517.build, 'build', build)
+    monkeypatch.setattr(pysrpm.rpm, 'librpm', None)
+    return run_subproc, build
 
 def get_rpm_instance(source=package_root, **options):
     return pysrpm.rpm.RPM(source, **options)
 
+def dest_files():
+    # List the destination directory once, to check several files
+    return {entry.name for entry in os.scandir(dirs['dest_dir'])} if dirs['dest_dir'].exists() else set()
+
+def make_sdist(directory, files):
+    # Source distribution tarball with the given file names and contents, in its top-level package-0.0.0 directory
+    sdist = directory / 'package-0.0.0.tar.gz'
+    with tarfile.open(sdist, 'w:gz') as tf:
+        for name, contents in files.items():
+            info = tarfile.TarInfo(f'package-0.0.0/{name}')
+            info.size = len(contents.encode())
+            tf.addfile(info, io.BytesIO(contents.encode()))
+    return sdist
+
 def run(**options):
     with get_rpm_instance(**options) as rpm:
         rpm.run()
 
 
 # Actual tests
-@dir_cleanup
-def test_meta_loading():
-    # Check the meta.load() is called only when extract_dependencies are required,
+def test_meta_loading(source_fs, pkg_info_text, build_metadata):
+    # Check the metadata is built only when extract_dependencies are required,
     # use dry runs to check no destination dir is created
-    pysrpm.rpm.pep517.meta.load.reset_mock()
-    pysrpm.rpm.pep517.meta.load.assert_not_called()
+    build_metadata.assert_not_called()
 
     # ensure PKG-INFO file exists
     pkg_info = package_root / 'PKG-INFO'
-    with open(pkg_info, 'w') as f:
-        print(dist.metadata.as_string(), file=f)
+    source_fs.create_file(pkg_info, contents=pkg_info_text)
 
-    try:
-        run(spec_only=True, dry_run=True, **dirs, extract_dependencies=False)
-        pysrpm.rpm.pep517.meta.load.assert_not_called()
-    finally:
-        pkg_info.unlink()
+    run(spec_only=True, dry_run=True, **dirs, extract_dependencies=False)
+    build_metadata.assert_not_called()
+    pkg_info.unlink()
 
     run(spec_only=True, dry_run=True, **dirs, extract_dependencies=True)
-    pysrpm.rpm.pep517.meta.load.assert_called()
+    build_metadata.assert_called()
 
     assert not dirs['dest_dir'].exists()
 
 
-@dir_cleanup
-def test_rpmbuild_variants():
-    with unittest.mock.patch('pysrpm.rpm.subprocess.run') as run_subproc, unittest.mock.patch('pysrpm.rpm.pep517.build.build') as build:
-        run_subproc.side_effect = mock_subproc
-
-        # Test spec only without dry-run: should create the spec file, no build directories, no subprocess or pep517.build calls
-        run(spec_only=True, keep_temp=True, **dirs)
-
-        run_subproc.assert_not_called()
-        build.assert_not_called()
-        assert (dirs['dest_dir'] / 'python3-package.spec').exists()
-        assert not dirs['rpm_base'].exists()
-
-        # Test source only, check dry run does not create any files in destination
-        run(source_only=True, **dirs, dry_run=True)
-
-        run_subproc.assert_called_with(['rpmbuild', '-bs', *rpmbuild_args], **suproc_args)
-        build.assert_called_once()
-        assert len(list(dirs['dest_dir'].glob('*.rpm'))) == 0
-
-        # Test binary only, check dry run does not create any files in destination
-        run(binary_only=True, **dirs, dry_run=True)
-
-        run_subproc.assert_called_with(['rpmbuild', '-bb', *rpmbuild_args], **suproc_args)
-        assert len(list(dirs['dest_dir'].glob('*.rpm'))) == 0
-
-        # Test binary + source, check no-dry-run creates the destination files
-        run(source_only=False, **dirs)
-
-        run_subproc.assert_called_with(['rpmbuild', '-ba', *rpmbuild_args], **suproc_args)
-        assert (dirs['dest_dir'] / 'python3-package-0.0.0.src.rpm').exists()
-        assert (dirs['dest_dir'] / 'python3-package-0.0.0.noarch.rpm').exists()
-
-
-@dir_cleanup
-def test_rpmbuild_errors():
-    with unittest.mock.patch('pysrpm.rpm.subprocess.run') as run_subproc, unittest.mock.patch('pysrpm.rpm.pep517.build.build') as build:
-        # Just a return value without side-effect: simulates rpmbuild (silently) not generating file
-        run_subproc.return_value = proc
-
-        # check the build specfile is generated, the rpmbuild command is correct, and the verification of file outputs throws an error
-        with pytest.raises(pysrpm.rpm.RPMBuildError, match='Expected source rpm not found'):
-            run(**dirs, keep_temp=True)
-
-        spec_path = dirs['rpm_base'] / 'SPECS' / 'python3-package.spec'
-        assert spec_path.exists()
-        spec_path.unlink()
-        build.assert_called_once()
-        run_subproc.assert_called_with(['rpmbuild', '-bs', *(arg for arg in rpmbuild_args if arg != '--clean')], **suproc_args)
-
-        # Test cleanup of build, even in case of error − specifically binary only
-        with pytest.raises(pysrpm.rpm.RPMBuildError, match='No binary rpm found, expected at least one'):
-            run(binary_only=True, **dirs)
-
-        assert not spec_path.exists()
-        assert not dirs['rpm_base'].exists()
-        run_subproc.assert_called_with(['rpmbuild', '-bb', *rpmbuild_args], **suproc_args)
+def test_sdist_entry_points(tmp_path, pkg_info_text):
+    # Entry points are read from an sdist’s egg-info without fully extracting it
+    sdist = make_sdist(tmp_path, {'PKG-INFO': pkg_info_text, 'setup.py': '', 'package.egg-info/PKG-INFO': pkg_info_text,
+                                  'package.egg-info/entry_points.txt': '[console_scripts]\nPackage-CLI = package:main\n',
+                                  'package/entry_points.txt': '[console_scripts]\nOther = package:main\n'})
+
+    with get_rpm_instance(sdist, extract_dependencies=False) as rpm:
+        rpm.load_configuration()
+        metadata = rpm.load_source_metadata(rpm.root, False)
+        assert not (rpm.root / 'package').exists()
+
+    assert metadata['entry-points'] == 'Package-CLI'
+
+
+@pytest.mark.parametrize('installed,hooks_used', [
+    pytest.param({'setuptools', 'wheel', 'wheel-requirement'}, True, id='installed'),
+    pytest.param({'setuptools', 'wheel'}, False, id='missing-wheel-requirement'),
+    pytest.param(set(), False, id='missing-backend'),
+])
+def test_build_metadata(monkeypatch, pkg_info_text, installed, hooks_used):
+    # Installed backends are called directly, otherwise pep517 builds the metadata in an isolated environment
+    def prepare_metadata(metadata_directory, config_settings):
+        dist_info = pathlib.Path(metadata_directory) / 'package-0.0.0.dist-info'
+        dist_info.mkdir()
+        (dist_info / 'METADATA').write_text(pkg_info_text)
+        (dist_info / 'entry_points.txt').write_text('[console_scripts]\nMyTool = package:main\n')
+        return dist_info.name
+
+    hooks = unittest.mock.Mock()
+    hooks.subprocess_runner.return_value = contextlib.nullcontext()
+    hooks.get_requires_for_build_wheel.return_value = ['wheel-requirement']
+    hooks.prepare_metadata_for_build_wheel.side_effect = prepare_metadata
+    hook_caller, load = unittest.mock.Mock(return_value=hooks), unittest.mock.Mock()
+    monkeypatch.setattr(pysrpm.rpm.pep517.wrappers, 'Pep517HookCaller', hook_caller)
+    monkeypatch.setattr(pep517.meta, 'load', load)
+    monkeypatch.setattr(pysrpm.rpm.RPM, '_is_installed', lambda req: req in installed)
+
+    metadata, entry_points = build_metadata(package_root)
+
+    # The backend hooks are only called if the backend is installed, to check the requirements to build metadata
+    assert hook_caller.called == bool(installed)
+    assert hooks.prepare_metadata_for_build_wheel.called == hooks_used
+    if hooks_used:
+        hook_caller.assert_called_once_with(str(package_root), 'setuptools.build_meta:__legacy__', None)
+        assert metadata['Name'] == 'package'
+        assert [ep.name for ep in entry_points] == ['MyTool']
+    else:
+        load.assert_called_once_with(package_root)
+        assert (metadata, entry_points) == (load.return_value.metadata, load.return_value.entry_points)
+
+
+@pytest.mark.parametrize('source,dynamic,built', [
+    pytest.param('sdist', False, False, id='sdist'),
+    pytest.param('sdist', True, True, id='sdist-dynamic'),
+    pytest.param('directory', False, True, id='directory'),
+])
+def test_static_dependencies(tmp_path, pkg_info_text, mock_dist, build_metadata, source, dynamic, built):
+    # From metadata version 2.2, dependencies in PKG-INFO are final unless dynamic (PEP 643), but only sdists’ PKG-INFO
+    # is trusted: a source directory’s egg-info could be left over from any previous build
+    pkg_info = pkg_info_text.replace('Metadata-Version: 2.1\n', 'Metadata-Version: 2.2\n'
+                                     + ('Dynamic: Requires-Dist\n' if dynamic else ''))
+    files = {'PKG-INFO': pkg_info, 'setup.py': '', 'package.egg-info/PKG-INFO': pkg_info,
+             'package.egg-info/entry_points.txt': '[console_scripts]\nMyTool = package:main\n'}
+    if source == 'sdist':
+        source = make_sdist(tmp_path, files)
+    else:
+        source = tmp_path / 'package'
+        (source / 'package.egg-info').mkdir(parents=True)
+        for name, contents in files.items():
+            if name != 'PKG-INFO':
+                (source / name).write_text(contents)
+
+    with get_rpm_instance(source) as rpm:
+        rpm.load_configuration()
+        metadata = rpm.load_source_metadata(rpm.root, True)
+
+    assert build_metadata.called == built
+    assert metadata['requires-dist'] == mock_dist.metadata.get_all('Requires-Dist')
+    # Entry point names are case sensitive
+    assert metadata.get('entry-points') == (None if built else 'MyTool')
+
+
+def test_rpmbuild_variants(source_fs, rpm_commands):
+    run_subproc, build = rpm_commands
+    run_subproc.side_effect = mock_subproc(source_fs)
+
+    # Test spec only without dry-run: should create the spec file, no build directories, no subprocess or pep517.build calls
+    run(spec_only=True, keep_temp=True, **dirs)
+
+    run_subproc.assert_not_called()
+    build.assert_not_called()
+    assert 'python3-package.spec' in dest_files()
+    assert not dirs['rpm_base'].exists()
+
+    # Test source only, check dry run does not create any files in destination
+    run(source_only=True, **dirs, dry_run=True)
+
+    run_subproc.assert_called_with(['rpmbuild', '-bs', *rpmbuild_args], **suproc_args)
+    build.assert_called_once()
+    assert not any(name.endswith('.rpm') for name in dest_files())
+
+    # Test binary only, check dry run does not create any files in destination
+    run(binary_only=True, **dirs, dry_run=True)
+
+    run_subproc.assert_called_with(['rpmbuild', '-bb', *rpmbuild_args], **suproc_args)
+    assert not any(name.endswith('.rpm') for name in dest_files())
+
+    # Test binary + source, check no-dry-run creates the destination files
+    run(source_only=False, **dirs)
+
+    run_subproc.assert_called_with(['rpmbuild', '-ba', *rpmbuild_args], **suproc_args)
+    assert {'python3-package-0.0.0.src.rpm', 'python3-package-0.0.0.noarch.rpm'} <= dest_files()
+
+
+def test_rpmbuild_errors(source_fs, rpm_commands):
+    run_subproc, build = rpm_commands
+    # Just a return value without side-effect: simulates rpmbuild (silently) not generating file
+    run_subproc.return_value = proc
+
+    # check the build specfile is generated, the rpmbuild command is correct, and the verification of file outputs throws an error
+    with pytest.raises(pysrpm.rpm.RPMBuildError, match='Expected source rpm not found'):
+        run(**dirs, keep_temp=True)
+
+    spec_path = dirs['rpm_base'] / 'SPECS' / 'python3-package.spec'
+    assert spec_path.exists()
+    spec_path.unlink()
+    build.assert_called_once()
+    run_subproc.assert_called_with(['rpmbuild', '-bs', *(arg for arg in rpmbuild_args if arg != '--clean')], **suproc_args)
+
+    # Test cleanup of build, even in case of error − specifically binary only
+    with pytest.raises(pysrpm.rpm.RPMBuildError, match='No binary rpm found, expected at least one'):
+        run(binary_only=True, **dirs)
+
+    assert not spec_path.exists()
+    assert not dirs['rpm_base'].exists()
+    run_subproc.assert_called_with(['rpmbuild', '-bb', *rpmbuild_args], **suproc_args)
+
+
+@pytest.mark.parametrize('link_errno,copied', [(None, False), (errno.EXDEV, True), (errno.EMLINK, True), (errno.EIO, False)])
+def test_copy_fallback(tmp_path, monkeypatch, link_errno, copied):
+    orig, dest = tmp_path / 'orig', tmp_path / 'dest'
+    orig.write_text('contents')
+    copy2 = unittest.mock.Mock(wraps=pysrpm.rpm.shutil.copy2)
+    monkeypatch.setattr(pysrpm.rpm.shutil, 'copy2', copy2)
+    if link_errno is not None:
+        monkeypatch.setattr(pysrpm.rpm.os, 'link', unittest.mock.Mock(side_effect=OSError(link_errno, 'link')))
+
+    # Only errors meaning links are not possible fall back to copying, others are raised
+    if link_errno is None or copied:
+        get_rpm_instance()._copy(orig, dest)
+        assert dest.read_text() == 'contents'
+        assert dest.samefile(orig) != copied
+    else:
+        with pytest.raises(OSError):
+            get_rpm_instance()._copy(orig, dest)
+    assert copy2.called == copied
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_run_many(tmp_path, pkg_info_text, jobs):
+    # Sources are real copies of the package, with different names and PKG-INFO so that no metadata is built
+    sources = [tmp_path / name for name in ('first', 'second')]
+    for source in sources:
+        shutil.copytree(package_root, source, ignore=shutil.ignore_patterns('__pycache__', 'PKG-INFO', '*.egg-info'))
+        (source / 'PKG-INFO').write_text(pkg_info_text.replace('Name: package', f'Name: {source.name}'))
+
+    pysrpm.rpm.RPM.run_many(sources, jobs, spec_only=True, extract_dependencies=False,
+                            dest_dir=tmp_path / 'dist', rpm_base=tmp_path / 'build')
+
+    assert {entry.name for entry in os.scandir(tmp_path / 'dist')} == {'python3-first.spec', 'python3-second.spec'}
+    assert not (tmp_path / 'build').exists()
+
+
+@pytest.mark.parametrize('keep_temp', [False, True])
+def test_run_many_cleanup(tmp_path, monkeypatch, keep_temp):
+    # Parallel conversions build in subdirectories of the build directory, which is removed once they are all done.
+    # Use threads to keep the mocks, and only create the build directories.
+    def make_directories(self):
+        self.load_configuration()
+        self._make_directories()
+
+    monkeypatch.setattr(pysrpm.rpm.concurrent.futures, 'ProcessPoolExecutor', concurrent.futures.ThreadPoolExecutor)
+    monkeypatch.setattr(pysrpm.rpm.RPM, 'run', make_directories)
+    pysrpm.rpm.RPM.run_many([package_root, package_root], 2, keep_temp=keep_temp, extract_dependencies=False,
+                            dest_dir=tmp_path / 'dist', rpm_base=tmp_path / 'build')
+
+    if keep_temp:
+        assert sorted(os.listdir(tmp_path / 'build')) == ['job-0', 'job-1']
+    else:
+        assert not (tmp_path / 'build').exists()
+
+
+def test_cli_sources(tmp_path, monkeypatch):
+    # Several sources are converted in a single call, with the number of jobs and the other options
+    run_many = unittest.mock.Mock()
+    monkeypatch.setattr(pysrpm.rpm.RPM, 'run_many', run_many)
+    sources = [str(tmp_path / name) for name in ('first.tar.gz', 'second.tar.gz')]
+    for source in sources:
+        pathlib.Path(source).touch()
+
+    result = CliRunner().invoke(pysrpm.__main__.cli, ['--jobs', '2', '--spec-only', '-t', 'arch', 'x86_64', *sources])
+
+    assert result.exit_code == 0, result.output
+    run_many.assert_called_once_with(tuple(sources), 2, templates={'arch': 'x86_64'},
+                                     spec_only=True, project_config=False)
+
+
+# Fake tar commands, that identify as GNU tar (and fail to extract) or as bsdtar (and reject GNU options)
+fake_tar = {
+    'failing': ('tar (GNU tar) 1.34', 'tar: package-0.0.0.tar.gz: Cannot open: Permission denied', 2),
+    'bsdtar': ('bsdtar 3.5.1 - libarchive 3.5.1', 'tar: Option --skip-old-files is not supported', 1),
+}
+
+@pytest.mark.parametrize('tar', ['native', 'missing', 'failing', 'bsdtar'])
+def test_full_extraction(tmp_path, monkeypatch, capsys, request, pkg_info_text, tar):
+    # Without GNU tar python extracts the sdist instead, and if GNU tar fails the reason is reported
+    sdist = make_sdist(tmp_path, {'PKG-INFO': pkg_info_text, 'setup.py': '', 'package/__init__.py': ''})
+    pysrpm.rpm._gnu_tar.cache_clear()
+    request.addfinalizer(pysrpm.rpm._gnu_tar.cache_clear)
+    if tar == 'native' and not pysrpm.rpm._gnu_tar():
+        pytest.skip('No GNU tar command')
+    elif tar == 'missing':
+        monkeypatch.setenv('PATH', '')
+    elif tar in fake_tar:
+        version, error, returncode = fake_tar[tar]
+        (tmp_path / 'bin').mkdir()
+        (tmp_path / 'bin' / 'tar').write_text(f'#!/bin/sh\nif [ "$1" = --version ]; then echo "{version}"; exit 0; fi\n'
+                                              f'echo "{error}" >&2\nexit {returncode}\n')
+        (tmp_path / 'bin' / 'tar').chmod(0o755)
+        monkeypatch.setenv('PATH', str(tmp_path / 'bin'))
+
+    with get_rpm_instance(sdist) as rpm:
+        assert not (rpm.root / 'package').exists()
+        rpm.full_extraction()
+        assert (rpm.root / 'package' / '__init__.py').exists()
+
+    errors = capsys.readouterr().err
+    assert ('WARNING' in errors) == (tar == 'failing')
+    assert ('Permission denied' in errors) == (tar == 'failing')
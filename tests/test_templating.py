@@ -1,4 +1,8 @@
 import pathlib
+import functools
+import collections
+import pytest
+import unittest.mock
 import pysrpm.rpm
 
 
@@ -12,49 +16,136 @@ def get_metadata(with_deps=False, **options):
         rpm.load_configuration()
         return rpm.load_source_metadata(rpm.root, with_deps)
 
-def get_specfile(tag=None, **options):
+@pytest.fixture(scope='module')
+def default_rpm(mock_dist):
+    # Shared RPM with the default configuration loaded, and the package info it extracts. This is module-scoped so it
+    # patches metadata building itself rather than relying on the per-test build_metadata fixture.
+    build_metadata = unittest.mock.patch.object(pysrpm.rpm.RPM, '_build_metadata',
+                                                return_value=(mock_dist.metadata, mock_dist.entry_points))
+    with build_metadata, get_rpm_instance() as rpm:
+        rpm.load_configuration()
+        yield rpm, rpm.load_source_metadata(rpm.root, False)
+
+class FrozenDict(tuple):
+    # Hashable stand-in for dict options, distinct from options that really are tuples
+    pass
+
+@functools.cache
+def make_specfile(frozen_options):
+    options = {key: dict(value) if type(value) is FrozenDict else value for key, value in frozen_options}
     with get_rpm_instance(**options) as rpm:
         rpm.load_configuration()
         pkg_info = rpm.load_source_metadata(rpm.root, False)
+        return rpm.make_spec(pkg_info)
+
+@functools.cache
+def index_specfile(frozen_options):
+    # Values of each "Tag: value" line of the spec file, in a single pass
+    tags = collections.defaultdict(list)
+    for tag, sep, value in (line.partition(': ') for line in make_specfile(frozen_options).splitlines()):
+        if sep:
+            tags[tag].append(value.strip())
+    return tags
+
+def get_specfile(tag=None, **options):
+    # Specs are generated once per set of options, so options (and dict options such as templates) are made hashable
+    frozen_options = tuple(sorted((key, FrozenDict(sorted(value.items())) if type(value) is dict else value)
+                                  for key, value in options.items()))
+    if tag:
+        return list(index_specfile(frozen_options).get(tag, []))
+    else:
+        return make_specfile(frozen_options)
+
+
+@pytest.mark.parametrize('config_name,config_text,options,provides', [
+    pytest.param(None, None, {}, 'python%{python3_version}dist(package) = 0.0.0', id='default'),
+    pytest.param(None, None, dict(templates=dict(python_dist='python-{name}')), 'python-package = 0.0.0', id='kwargs'),
+    # Config file with an inherited flavour
+    pytest.param('test.config', '[pysrpm]\nflavour=test\n[test]\npython_dist=python-{name}\n',
+                 {}, 'python-package = 0.0.0', id='ini'),
+    # Inherit through several levels, whatever the order of the sections
+    pytest.param('test.config', '[pysrpm]\nflavour=test\n[test]\ninherits=parent\n[parent]\npython_dist=python-{name}\n',
+                 {}, 'python-package = 0.0.0', id='ini-ancestry'),
+    pytest.param('test.toml', '''[tool.pysrpm]\nflavour = 'test'\n[tool.pysrpm.test]\npython_dist = "python-{name}"\n''',
+                 {}, 'python-package = 0.0.0', id='toml'),
+])
+def test_template_specialisation(tmp_path, config_name, config_text, options, provides):
+    if config_name is not None:
+        options = {**options, 'config': tmp_path / config_name}
+        options['config'].write_text(config_text)
+
+    assert get_specfile('Provides', **options) == [provides]
+
+
+@pytest.mark.parametrize('section', ['test', 'pysrpm.test'])
+def test_config_sections(section):
+    # Sections may be prefixed with pysrpm., in which case other sections are ignored
+    sections = pysrpm.rpm.RPM._config_sections(['pysrpm', section, 'other'])
+
+    assert sections['pysrpm'] == 'pysrpm'
+    assert sections['test'] == section
+    assert ('other' in sections) == (section == 'test')
+
+
+def test_project_config_interpolation(tmp_path):
+    # Only the pysrpm sections of a project’s setup.cfg are interpolated, others may use a different syntax
+    cfg = tmp_path / 'setup.cfg'
+    cfg.write_text('[pysrpm]\nflavour=test\n[pysrpm.test]\npython_dist=python-{name}\n'
+                   '[flake8]\nformat = %(path)s:%(row)d: %(code)s %(text)s\n')
+    assert get_specfile('Provides', config=cfg, project_config=True) == ['python-package = 0.0.0']
+
+
+def test_circular_inheritance(tmp_path):
+    cfg = tmp_path / 'test.config'
+    cfg.write_text('[pysrpm]\nflavour=test\n[test]\ninherits=parent\n[parent]\ninherits=test\n')
+    with pytest.raises(ValueError, match='Circular flavour inheritance'):
+        get_specfile('Provides', config=cfg)
+
+
+def test_toml_config_reload(tmp_path):
+    # Loading the same (cached) TOML file again gives the same configuration
+    cfg = tmp_path / 'test.toml'
+    cfg.write_text('''[tool.pysrpm]\nflavour = 'test'\n[tool.pysrpm.test]\npython_dist = "python-{name}"\n''')
+    for _ in range(2):
+        with get_rpm_instance(config=cfg) as rpm:
+            rpm.load_configuration()
+            assert rpm.templates['python_dist'] == 'python-{name}'
+
+    # Modifying the file invalidates the cache
+    cfg.write_text('''[tool.pysrpm]\nflavour = 'test'\n[tool.pysrpm.test]\npython_dist = "py-{name}"\n''')
+    with get_rpm_instance(config=cfg) as rpm:
+        rpm.load_configuration()
+        assert rpm.templates['python_dist'] == 'py-{name}'
+
+
+def test_static_binary_rpm_names(default_rpm):
+    # Default release uses the %{?dist} macro, which only rpm can evaluate
+    rpm, pkg_info = default_rpm
+    spec = rpm.make_spec(pkg_info)
+    assert pysrpm.rpm.RPM._static_binary_rpms(spec) is None
+
+    spec = spec.replace('%{?dist}', '')
+    assert pysrpm.rpm.RPM._static_binary_rpms(spec) == [pathlib.Path('noarch/python3-package-0.0.0-1.noarch.rpm')]
+    assert pysrpm.rpm.RPM._static_binary_rpms(spec + '\n\n%package extra\nSummary: Extra') is None
+
+
+def test_query_binary_rpm_names(default_rpm, tmp_path, monkeypatch):
+    # Parsing the spec with the rpm python module gives the same rpm names as reading them from the preamble
+    monkeypatch.setattr(pysrpm.rpm, 'librpm', pytest.importorskip('rpm'))
+    rpm, pkg_info = default_rpm
+    spec = rpm.make_spec(pkg_info).replace('%{?dist}', '')
+    spec_file = tmp_path / 'python3-package.spec'
+    spec_file.write_text(spec + '\n')
+    assert rpm._query_binary_rpms(spec_file) == pysrpm.rpm.RPM._static_binary_rpms(spec)
+
 
-        spec = rpm.make_spec(pkg_info)
-        if tag:
-            return [line.split(':', 1)[1].strip() for line in spec.split('\n') if line.startswith(f'{tag}: ')]
-        else:
-            return spec
-
-
-def test_template_specialisation():
-    # Default
-    assert get_specfile('Provides') == ['python%{python3_version}dist(package) = 0.0.0']
-
-    # CLI / kwargs override
-    assert get_specfile('Provides', templates=dict(python_dist='python-{name}')) == ['python-package = 0.0.0']
-
-    # Try from a config file with an inherited flavour
-    cfg = pathlib.Path('test.config')
-    with open(cfg, 'w') as f:
-        print('[pysrpm]\nflavour=test\n[test]\npython_dist=python-{name}', file=f)
-
-    try:
-        assert get_specfile('Provides', config=cfg) == ['python-package = 0.0.0']
-    finally:
-        cfg.unlink()
-
-    # Add pysrpm. to config section
-    with open(cfg, 'w') as f:
-        print('[pysrpm]\nflavour=test\n[pysrpm.test]\npython_dist=python-{name}', file=f)
-
-    try:
-        assert get_specfile('Provides', config=cfg) == ['python-package = 0.0.0']
-    finally:
-        cfg.unlink()
-
-    # Try from a TOML config file
-    cfg = pathlib.Path('test.toml')
-    with open(cfg, 'w') as f:
-        print('''[tool.pysrpm]\nflavour = 'test'\n[tool.pysrpm.test]\npython_dist = "python-{name}"''', file=f)
-    try:
-        assert get_specfile('Provides', config=cfg) == ['python-package = 0.0.0']
-    finally:
-        cfg.unlink()
+def test_optional_keys(default_rpm):
+    rpm, _ = default_rpm
+    template = 'Name: {name}\nEpoch: {epoch}\nVersion: {version}'
+    assert rpm._format_lines(template, {'name': 'foo', 'version': '1.0'}) == ['Name: foo', 'Version: 1.0']
+    with pytest.raises(KeyError, match='version'):
+        rpm._format_lines(template, {'name': 'foo'})
+    values = {'name': 'foo', 'epoch': '1', 'version': '1.0'}
+    assert rpm._format_lines(template, values) == ['Name: foo', 'Epoch: 1', 'Version: 1.0']
+    with pytest.raises(ValueError, match='Error formatting line: Epoch: {epoch:d}'):
+        rpm._format_lines(template.replace('{epoch}', '{epoch:d}'), values)